@@ -12,12 +12,189 @@ This was modified by Tin Tran to scrape the Z-Library website for book informati
 """
 
 import requests
+from urllib.parse import quote, urlsplit
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import re
 import html
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import lru_cache
 import os # Needed for file operations
+import time
 import json # Import json module here
+import logging
+import threading
+import hashlib
+
+_log = logging.getLogger(__name__)
+
+# orjson is optional; it decodes API responses noticeably faster than json.
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+# Patterns used by search_scrape, compiled once. They run on the raw response
+# bytes so the full page never has to be decoded; only the short title and
+# author captures are decoded.
+# Card blocks are located with bytes.find (memchr/two-way in C) rather than a
+# regex; custom element names are always lowercase, so the search can be exact.
+_CARD_OPEN = b"<z-bookcard"
+_CARD_CLOSE = b"</z-bookcard>"
+_ID_RE = re.compile(rb'id="(\d+)"')
+_HASH_RE = re.compile(rb'href="/book/\d+/([a-z0-9]+)/')
+_TITLE_RE = re.compile(rb'<div\s+slot="title">(.*?)</div>', re.IGNORECASE)
+_AUTHOR_RE = re.compile(rb'<div\s+slot="author">(.*?)</div>', re.IGNORECASE)
+# All four card fields in one sweep, anchored at the card start (use .match()).
+# The opening tag is walked with [^>] so the attribute block never backtracks;
+# title/author stay single-line like _TITLE_RE/_AUTHOR_RE.
+_CARD_FIELDS_RE = re.compile(
+    rb'(?i:<z-bookcard)\b[^>]*?\sid="(?P<id>\d+)"'
+    rb'[^>]*?\shref="/book/\d+/(?P<hash>[a-z0-9]+)/[^>]*>'
+    rb'.*?(?i:<div\s+slot="title">)(?P<title>[^\n]*?)</div>'
+    rb'.*?(?i:<div\s+slot="author">)(?P<author>[^\n]*?)</div>',
+    re.DOTALL,
+)
+_HREF_HASH_RE = re.compile(r'^/book/\d+/([a-z0-9]+)/')
+_PIPE_TBL = str.maketrans({"|": " "}) # Keeps titles/authors from breaking the ID|HASH|TITLE|AUTHOR format
+
+# selectolax is optional; when installed, book cards are read from a DOM built
+# by its C (lexbor) parser instead of being picked apart with four regexes.
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+class ZlibraryAuthError(Exception):
+    """Raised when an API call that needs a login is made before logging in."""
+
+class _SessionRetry(Retry):
+    """Retry that resends a POST only when the server cannot have acted on it.
+
+    POST is not in allowed_methods, so urllib3 retries it only on connect
+    errors, where the request was never sent. is_retry adds 429 and 503, which
+    refuse a request without processing it. Registration, password recovery
+    and token sign-in POSTs are not idempotent, so read errors and other 5xx
+    replies are never resent.
+    """
+    POST_RETRY_STATUSES = frozenset({429, 503})
+
+    def is_retry(self, method: str, status_code: int, has_retry_after: bool = False) -> bool:
+        if method.upper() == "POST":
+            return bool(self.total) and status_code in self.POST_RETRY_STATUSES
+        return super().is_retry(method, status_code, has_retry_after)
+
+def _make_retry() -> Retry:
+    """Retry policy for the shared session: only connection errors, 429 and 5xx (POSTs: 429/503).
+
+    Waits grow exponentially (0.5s, 1s, 2s...) up to 30s, honour Retry-After,
+    and get random jitter on urllib3 2.x so parallel workers don't retry in lockstep.
+    """
+    retry_kwargs = dict(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        # POSTs are handled separately by _SessionRetry.is_retry
+        allowed_methods=frozenset({"HEAD", "GET"}),
+        respect_retry_after_header=True,
+    )
+    try:
+        return _SessionRetry(backoff_jitter=0.5, backoff_max=30, **retry_kwargs)
+    except TypeError: # urllib3 1.x has neither option
+        return _SessionRetry(**retry_kwargs)
+
+@lru_cache(maxsize=16)
+def _download_headers(authority: str) -> dict[str, str]:
+    """Per-CDN-host extra headers for download requests; requests merges, never mutates, them."""
+    return {"authority": authority}
+
+def _compact(**kwargs) -> dict:
+    """Returns the keyword arguments that are not None, for use as request params."""
+    return {k: v for k, v in kwargs.items() if v is not None}
+
+def _card_text(raw: bytes) -> str:
+    """Decodes a captured title/author slot to clean text."""
+    return html.unescape(raw.decode("utf-8", "replace").strip())
+
+def _iter_card_blocks(html_content: bytes):
+    """Yields the raw bytes of each <z-bookcard>...</z-bookcard> block, in page order."""
+    find = html_content.find
+    pos = find(_CARD_OPEN)
+    while pos != -1:
+        after_name = pos + len(_CARD_OPEN)
+        # Skip longer tag names such as <z-bookcard-list>
+        if html_content[after_name:after_name + 1] not in b" \t\r\n\f/>":
+            pos = find(_CARD_OPEN, after_name)
+            continue
+        end = find(_CARD_CLOSE, after_name)
+        if end == -1: # Truncated page: no more complete cards
+            return
+        end += len(_CARD_CLOSE)
+        yield html_content[pos:end]
+        pos = find(_CARD_OPEN, end)
+
+def _iter_book_cards(html_content: bytes):
+    """Yields (card_html, id, hash, title, authors) for each <z-bookcard> on a page.
+
+    card_html is the card markup as bytes; any field that could not be
+    extracted is None.
+    """
+    if LexborHTMLParser is not None:
+        for node in LexborHTMLParser(html_content).css("z-bookcard"):
+            book_id = node.attributes.get("id")
+            hash_match = _HREF_HASH_RE.search(node.attributes.get("href") or "")
+            title_node = node.css_first('div[slot="title"]')
+            author_node = node.css_first('div[slot="author"]')
+            yield (
+                node.html.encode("utf-8"),
+                book_id if book_id and book_id.isdigit() else None,
+                hash_match.group(1) if hash_match else None,
+                title_node.text().strip() if title_node else None, # Entities decoded; inner spacing kept like the regex path
+                author_node.text().strip() if author_node else None,
+            )
+        return
+
+    for card_text in _iter_card_blocks(html_content):
+
+        fields_match = _CARD_FIELDS_RE.match(card_text)
+        if fields_match:
+            yield (
+                card_text,
+                fields_match["id"].decode("ascii"),
+                fields_match["hash"].decode("ascii"),
+                _card_text(fields_match["title"]),
+                _card_text(fields_match["author"]),
+            )
+            continue
+
+        # Fall back to per-field searches, e.g. for cards without an author slot.
+        # Missing fields come back as None; search_scrape skips cards without id/hash.
+        # The captures are ASCII digits/[a-z0-9] or decoded with "replace", so
+        # nothing here can raise and no try/except is needed per card.
+        id_match = _ID_RE.search(card_text)
+        book_id = id_match.group(1).decode("ascii") if id_match else None
+
+        hash_match = _HASH_RE.search(card_text)
+        book_hash = hash_match.group(1).decode("ascii") if hash_match else None
+
+        title_match = _TITLE_RE.search(card_text)
+        title = _card_text(title_match.group(1)) if title_match else None
+
+        author_match = _AUTHOR_RE.search(card_text)
+        authors = _card_text(author_match.group(1)) if author_match else None
+
+        yield card_text, book_id, book_hash, title, authors
 
 class Zlibrary:
+    # Seconds to reuse responses from the reference-data /eapi/info endpoints
+    INFO_CACHE_TTL = 3600
+    # On-disk copy of the same responses so restarts skip the round-trip; None disables it
+    DISK_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "zlib")
+    DISK_CACHE_TTL = 86400
+    # Largest body (bytes) read fully into memory; books always stream to disk
+    MAX_IN_MEM = 16 << 20
+
     def __init__(
         self,
         email: str = None,
@@ -32,8 +209,15 @@ class Zlibrary:
         self.__remix_userid: [int, str]
         self.__remix_userkey: str
         self.__domain = domain
+        self.__base_url = f"https://{domain}"
 
         self.__loggedin = False
+        self.__profile_cache = None
+        self.__profile_fetched_at = 0.0
+        # Successful downloadBook() calls since the cached profile was fetched
+        self.__downloads_since_refresh = 0
+        self.__profile_lock = threading.Lock()
+        self.__info_cache = {}
         self.__headers = {
             "Content-Type": "application/x-www-form-urlencoded",
             "accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
@@ -44,6 +228,20 @@ class Zlibrary:
             "siteLanguageV2": "en",
         }
 
+        # One pooled session for every call so repeated requests to the same
+        # host reuse keep-alive connections instead of re-handshaking TLS.
+        self.__session = requests.Session()
+        self.__session.headers.update(self.__headers)
+        self.__scopeSessionCookies()
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=32,
+            max_retries=_make_retry(),
+        )
+        # Download links point at CDN hosts that are not always https
+        self.__session.mount("https://", adapter)
+        self.__session.mount("http://", adapter)
+
         if email is not None and password is not None:
             self.login(email, password)
         elif remix_userid is not None and remix_userkey is not None:
@@ -61,9 +259,22 @@ class Zlibrary:
         self.__cookies["remix_userkey"] = self.__remix_userkey
         if domain_override:
             self.__domain = domain_override
+            self.__base_url = f"https://{domain_override}"
+        self.__scopeSessionCookies()
         self.__loggedin = True
+        self.invalidateProfile()
         return response
 
+    def __scopeSessionCookies(self) -> None:
+        """Puts the cookies on the session for the Z-Library host only.
+
+        Download links and covers live on third-party hosts, which must never
+        receive the remix_userkey login token.
+        """
+        self.__session.cookies.clear()
+        for name, value in self.__cookies.items():
+            self.__session.cookies.set(name, value, domain=self.__domain)
+
     def __login(self, email, password, domain_to_try=None) -> dict[str, str]:
         target_domain = domain_to_try or self.__domain
         return self.__setValues(
@@ -96,84 +307,89 @@ class Zlibrary:
     ) -> dict[str, str]:
         return self.__checkIDandKey(remix_userid, remix_userkey)
 
-    def __makePostRequest(
-        self, url: str, data: dict = {}, override=False, domain_override: str = None
-    ) -> dict[str, str]:
-        if not self.isLoggedIn() and override is False:
-            print("Not logged in")
-            return None
-
-        target_domain = domain_override or self.__domain
-
+    def __requestJson(self, method: str, full_url: str, url: str, **kwargs) -> dict[str, str]:
+        """Sends one API request on the session and decodes the JSON reply (None on error)."""
         try:
-            response = requests.post(
-                "https://" + target_domain + url,
-                data=data,
-                cookies=self.__cookies,
-                headers=self.__headers,
-            )
+            response = self.__session.request(method, full_url, timeout=30, **kwargs)
             response.raise_for_status()
-            return response.json()
+            return _loads(response.content)
         except requests.exceptions.RequestException as e:
-            print(f"Error in POST request to {url}: {e}")
+            _log.warning("Error in %s request to %s: %s", method, url, e)
             return None
-        except requests.exceptions.JSONDecodeError as e:
-            print(f"Error decoding JSON from POST {url}: {e} - Response: {response.text[:200]}")
+        except ValueError as e: # json.JSONDecodeError / orjson.JSONDecodeError
+            _log.warning("Error decoding JSON from %s %s: %s - Response: %r", method, url, e, response.content[:200])
             return None
 
-    def __makeGetRequest(
-        self, url: str, params: dict = {}, cookies=None, domain_override: str = None
+    def __makePostRequest(
+        self, url: str, data: dict = None, override=False, domain_override: str = None
     ) -> dict[str, str]:
-        if not self.isLoggedIn() and cookies is None:
-            print("Not logged in")
-            return None
-
-        target_domain = domain_override or self.__domain
-        target_cookies = self.__cookies if cookies is None else cookies
+        if not self.__loggedin and override is False:
+            raise ZlibraryAuthError(f"Not logged in (POST {url})")
 
-        try:
-            response = requests.get(
-                "https://" + target_domain + url,
-                params=params,
-                cookies=target_cookies,
-                headers=self.__headers,
-            )
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"Error in GET request to {url}: {e}")
-            return None
-        except requests.exceptions.JSONDecodeError as e:
-            print(f"Error decoding JSON from GET {url}: {e} - Response: {response.text[:200]}")
-            return None
+        base_url = self.__base_url if domain_override is None else f"https://{domain_override}"
+        return self.__requestJson("POST", base_url + url, url, data=data)
 
-    def getProfile(self) -> dict[str, str]:
-        return self.__makeGetRequest("/eapi/user/profile")
+    def __makeGetRequest(
+        self, url: str, params: dict = None, cookies=None, domain_override: str = None
+    ) -> dict[str, str]:
+        if not self.__loggedin and cookies is None:
+            raise ZlibraryAuthError(f"Not logged in (GET {url})")
+
+        base_url = self.__base_url if domain_override is None else f"https://{domain_override}"
+        return self.__requestJson("GET", base_url + url, url, params=params, cookies=cookies)
+
+    def __getJson(self, url: str) -> dict[str, str]:
+        """Fast path of __makeGetRequest for the common case: a bare path, no params or overrides."""
+        if not self.__loggedin:
+            raise ZlibraryAuthError(f"Not logged in (GET {url})")
+        return self.__requestJson("GET", self.__base_url + url, url)
+
+    def getProfile(self, max_age: float = 30.0) -> dict[str, str]:
+        """Returns the user profile, reusing the last response for up to max_age seconds."""
+        now = time.monotonic()
+        # Judged against this caller's max_age, not whatever an earlier caller asked for
+        if self.__profile_cache is not None and now - self.__profile_fetched_at < max_age:
+            return self.__profile_cache
+        profile = self.__getJson("/eapi/user/profile")
+        if profile: # Don't cache failed requests
+            with self.__profile_lock:
+                self.__profile_cache = profile
+                self.__profile_fetched_at = now
+                self.__downloads_since_refresh = 0
+        return profile
+
+    def invalidateProfile(self) -> None:
+        """Drops the cached profile so the next getProfile() hits the API."""
+        with self.__profile_lock:
+            self.__profile_cache = None
+            self.__profile_fetched_at = 0.0
+            self.__downloads_since_refresh = 0
 
     def getMostPopular(self, switch_language: str = None) -> dict[str, str]:
         if switch_language is not None:
             return self.__makeGetRequest(
                 "/eapi/book/most-popular", {"switch-language": switch_language}
             )
-        return self.__makeGetRequest("/eapi/book/most-popular")
+        return self.__getJson("/eapi/book/most-popular")
 
     def getRecently(self) -> dict[str, str]:
-        return self.__makeGetRequest("/eapi/book/recently")
+        return self.__getJson("/eapi/book/recently")
 
     def getUserRecommended(self) -> dict[str, str]:
-        return self.__makeGetRequest("/eapi/user/book/recommended")
+        return self.__getJson("/eapi/user/book/recommended")
 
     def deleteUserBook(self, bookid: [int, str]) -> dict[str, str]:
-        return self.__makeGetRequest(f"/eapi/user/book/{bookid}/delete")
+        self.invalidateProfile()
+        return self.__getJson(f"/eapi/user/book/{bookid}/delete")
 
     def unsaveUserBook(self, bookid: [int, str]) -> dict[str, str]:
-        return self.__makeGetRequest(f"/eapi/user/book/{bookid}/unsave")
+        return self.__getJson(f"/eapi/user/book/{bookid}/unsave")
 
     def getBookForamt(self, bookid: [int, str], hashid: str) -> dict[str, str]:
-        return self.__makeGetRequest(f"/eapi/book/{bookid}/{hashid}/formats")
+        return self.__getJson(f"/eapi/book/{bookid}/{hashid}/formats")
 
     def getDonations(self) -> dict[str, str]:
-        return self.__makeGetRequest("/eapi/user/donations")
+        return self.__getJson("/eapi/user/donations")
 
     def getUserDownloaded(
         self, order: str = None, page: int = None, limit: int = None
@@ -182,28 +398,81 @@ class Zlibrary:
         order takes one of the values\n
         ["year",...]
         """
-        params = {
-            k: v
-            for k, v in {"order": order, "page": page, "limit": limit}.items()
-            if v is not None
-        }
+        params = _compact(order=order, page=page, limit=limit)
         return self.__makeGetRequest("/eapi/user/book/downloaded", params)
 
+    def getUserDownloadedMany(
+        self, pages, order: str = None, limit: int = None, max_workers: int = 8
+    ) -> list[dict[str, str]]:
+        """Fetches several history pages concurrently, in the same order as pages."""
+        return self.__gather(
+            lambda page: self.getUserDownloaded(order=order, page=page, limit=limit),
+            pages,
+            max_workers,
+        )
+
+    def __getCachedInfo(self, url: str, switch_language: str = None) -> dict[str, str]:
+        """GETs a reference-data endpoint, reusing the response for INFO_CACHE_TTL seconds."""
+        # Same login check __makeGetRequest does, before any cached copy can be handed out
+        if not self.__loggedin:
+            raise ZlibraryAuthError(f"Not logged in (GET {url})")
+        key = (self.__remix_userid, url, switch_language)
+        now = time.monotonic()
+        cached = self.__info_cache.get(key)
+        if cached and now < cached[1]:
+            return cached[0]
+        cache_path = self.__diskCachePath(url, switch_language)
+        response = self.__readDiskCache(cache_path)
+        if response is None:
+            params = {"switch-language": switch_language} if switch_language is not None else None
+            response = self.__makeGetRequest(url, params)
+            if response: # Don't cache failed requests
+                self.__writeDiskCache(cache_path, response)
+        if response:
+            self.__info_cache[key] = (response, now + self.INFO_CACHE_TTL)
+        return response
+
+    def __diskCachePath(self, url: str, switch_language: str = None) -> str | None:
+        if not self.DISK_CACHE_DIR:
+            return None
+        # Keyed per account: getInfo/getPlans answers depend on the logged-in user
+        key = f"{self.__remix_userid}|{self.__base_url}{url}|{switch_language or ''}".encode()
+        return os.path.join(self.DISK_CACHE_DIR, hashlib.blake2b(key, digest_size=16).hexdigest() + ".json")
+
+    def __readDiskCache(self, path: str | None) -> dict[str, str] | None:
+        if path is None:
+            return None
+        try:
+            if time.time() - os.path.getmtime(path) >= self.DISK_CACHE_TTL:
+                return None
+            with open(path, "rb") as f:
+                return _loads(f.read())
+        except (OSError, ValueError): # Missing, unreadable or corrupt: just refetch
+            return None
+
+    def __writeDiskCache(self, path: str | None, response: dict[str, str]) -> None:
+        if path is None:
+            return
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.DISK_CACHE_DIR, exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(response, f)
+            os.replace(tmp_path, path) # Readers never see a half-written file
+        except (OSError, TypeError, ValueError) as e:
+            _log.debug("Could not write disk cache %s: %s", path, e)
+
     def getExtensions(self) -> dict[str, str]:
-        return self.__makeGetRequest("/eapi/info/extensions")
+        return self.__getCachedInfo("/eapi/info/extensions")
 
     def getDomains(self) -> dict[str, str]:
-        return self.__makeGetRequest("/eapi/info/domains")
+        return self.__getCachedInfo("/eapi/info/domains")
 
     def getLanguages(self) -> dict[str, str]:
-        return self.__makeGetRequest("/eapi/info/languages")
+        return self.__getCachedInfo("/eapi/info/languages")
 
     def getPlans(self, switch_language: str = None) -> dict[str, str]:
-        if switch_language is not None:
-            return self.__makeGetRequest(
-                "/eapi/info/plans", {"switch-language": switch_language}
-            )
-        return self.__makeGetRequest("/eapi/info/plans")
+        return self.__getCachedInfo("/eapi/info/plans", switch_language)
 
     def getUserSaved(
         self, order: str = None, page: int = None, limit: int = None
@@ -212,22 +481,14 @@ class Zlibrary:
         order takes one of the values\n
         ["year",...]
         """
-        params = {
-            k: v
-            for k, v in {"order": order, "page": page, "limit": limit}.items()
-            if v is not None
-        }
+        params = _compact(order=order, page=page, limit=limit)
         return self.__makeGetRequest("/eapi/user/book/saved", params)
 
     def getInfo(self, switch_language: str = None) -> dict[str, str]:
-        if switch_language is not None:
-            return self.__makeGetRequest(
-                "/eapi/info", {"switch-language": switch_language}
-            )
-        return self.__makeGetRequest("/eapi/info")
+        return self.__getCachedInfo("/eapi/info", switch_language)
 
     def hideBanner(self) -> dict[str, str]:
-        return self.__makeGetRequest("/eapi/user/hide-banner")
+        return self.__getJson("/eapi/user/hide-banner")
 
     def recoverPassword(self, email: str) -> dict[str, str]:
         return self.__makePostRequest(
@@ -245,10 +506,11 @@ class Zlibrary:
         return self.__makePostRequest("/eapi/user/email/confirmation/resend")
 
     def saveBook(self, bookid: [int, str]) -> dict[str, str]:
-        return self.__makeGetRequest(f"/eapi/user/book/{bookid}/save")
+        self.invalidateProfile()
+        return self.__getJson(f"/eapi/user/book/{bookid}/save")
 
     def sendTo(self, bookid: [int, str], hashid: str, totype: str) -> dict[str, str]:
-        return self.__makeGetRequest(f"/eapi/book/{bookid}/{hashid}/send-to-{totype}")
+        return self.__getJson(f"/eapi/book/{bookid}/{hashid}/send-to-{totype}")
 
     def getBookInfo(
         self, bookid: [int, str], hashid: str, switch_language: str = None
@@ -257,10 +519,20 @@ class Zlibrary:
             return self.__makeGetRequest(
                 f"/eapi/book/{bookid}/{hashid}", {"switch-language": switch_language}
             )
-        return self.__makeGetRequest(f"/eapi/book/{bookid}/{hashid}")
+        return self.__getJson(f"/eapi/book/{bookid}/{hashid}")
+
+    def getBookInfoMany(
+        self, books: list[dict[str, str]], switch_language: str = None, max_workers: int = 8
+    ) -> list[dict[str, str]]:
+        """Fetches getBookInfo for many books concurrently, in the same order as books."""
+        return self.__gather(
+            lambda book: self.getBookInfo(book["id"], book["hash"], switch_language),
+            books,
+            max_workers,
+        )
 
     def getSimilar(self, bookid: [int, str], hashid: str) -> dict[str, str]:
-        return self.__makeGetRequest(f"/eapi/book/{bookid}/{hashid}/similar")
+        return self.__getJson(f"/eapi/book/{bookid}/{hashid}/similar")
 
     def makeTokenSigin(self, name: str, id_token: str) -> dict[str, str]:
         return self.__makePostRequest(
@@ -276,18 +548,15 @@ class Zlibrary:
         name: str = None,
         kindle_email: str = None,
     ) -> dict[str, str]:
+        self.invalidateProfile()
         return self.__makePostRequest(
             "/eapi/user/update",
-            {
-                k: v
-                for k, v in {
-                    "email": email,
-                    "password": password,
-                    "name": name,
-                    "kindle_email": kindle_email,
-                }.items()
-                if v is not None
-            },
+            _compact(
+                email=email,
+                password=password,
+                name=name,
+                kindle_email=kindle_email,
+            ),
         )
 
     def search(
@@ -303,53 +572,77 @@ class Zlibrary:
     ) -> dict[str, str]:
         return self.__makePostRequest(
             "/eapi/book/search",
-            {
-                k: v
-                for k, v in {
-                    "message": message,
-                    "yearFrom": yearFrom,
-                    "yearTo": yearTo,
-                    "languages": languages,
-                    "extensions[]": extensions,
-                    "order": order,
-                    "page": page,
-                    "limit": limit,
-                }.items()
-                if v is not None
-            },
+            _compact(
+                message=message,
+                yearFrom=yearFrom,
+                yearTo=yearTo,
+                languages=languages,
+                order=order,
+                page=page,
+                limit=limit,
+                **{"extensions[]": extensions},
+            ),
         )
 
-    def __getImageData(self, url: str) -> bytes | None:
+    def __getImageData(self, url: str, sink=None, chunk_size: int = 1 << 16) -> bytes | int | None:
+        """Fetches an image; with a writable sink it is streamed there and the byte count returned."""
         try:
-            res = requests.get(url, headers=self.__headers)
-            res.raise_for_status()
-            if res.status_code == 200:
-                return res.content
-            return None
+            with self.__session.get(url, stream=True, timeout=30) as res:
+                res.raise_for_status()
+                if sink is not None:
+                    written = 0
+                    for chunk in res.iter_content(chunk_size=chunk_size):
+                        if chunk:
+                            written += sink.write(chunk) or len(chunk)
+                    return written
+                size = int(res.headers.get("Content-Length") or 0)
+                if size > self.MAX_IN_MEM:
+                    _log.warning("Refusing to buffer %s: Content-Length %d exceeds MAX_IN_MEM", url, size)
+                    return None
+                if res.status_code == 200:
+                    return res.content
+                return None
         except requests.exceptions.RequestException as e:
-            print(f"Error getting image data from {url}: {e}")
+            _log.warning("Error getting image data from %s: %s", url, e)
             return None
 
-    def getImage(self, book: dict[str, str]) -> bytes | None:
+    def getImage(self, book: dict[str, str], path: str = None) -> bytes | int | None:
+        """Returns the cover bytes, or streams them to path and returns the byte count."""
         cover_url = book.get("cover")
-        if cover_url:
+        if not cover_url:
+            return None
+        if path is None:
             return self.__getImageData(cover_url)
-        return None
+        # Written under a .part name and renamed on success, so a failed fetch leaves nothing at path
+        part_path = f"{path}.part"
+        with open(part_path, "wb") as f:
+            written = self.__getImageData(cover_url, sink=f)
+        if written is None:
+            try:
+                os.remove(part_path)
+            except OSError:
+                pass
+            return None
+        os.replace(part_path, path)
+        return written
+
+    def getImages(self, books: list[dict[str, str]], max_workers: int = 16) -> list[bytes | None]:
+        """Fetches getImage for many books concurrently, in the same order as books."""
+        return self.__gather(self.getImage, books, max_workers)
 
     def __getBookFile(self, bookid: [int, str], hashid: str) -> tuple[str, requests.Response] | None:
         """Initiates download, determines extension, and returns (extension, response_object)."""
-        response_info = self.__makeGetRequest(f"/eapi/book/{bookid}/{hashid}/file")
+        response_info = self.__getJson(f"/eapi/book/{bookid}/{hashid}/file")
         
         if not response_info or "file" not in response_info:
-            print(f"  ❌ Error: API response for book {bookid}/{hashid} did not contain 'file' key.")
-            print(f"  API Response: {response_info}")
+            _log.error("API response for book %s/%s did not contain 'file' key. API Response: %s", bookid, hashid, response_info)
             return None
 
         file_info = response_info["file"]
         # Determine extension from API, default to .bin
         extension = file_info.get("extension")
         if not extension: # Ensure extension is not empty or None
-            print(f"  ⚠️ Warning: API did not provide extension for book {bookid}. Defaulting to .bin")
+            _log.warning("API did not provide extension for book %s. Defaulting to .bin", bookid)
             file_extension = ".bin"
         else:
             # Ensure the extension starts with a dot
@@ -359,27 +652,24 @@ class Zlibrary:
 
         ddl = file_info.get("downloadLink")
         if not ddl:
-            print(f"❌ Error: No downloadLink found in API response for book {bookid}")
+            _log.error("No downloadLink found in API response for book %s", bookid)
             return None
 
-        download_headers = self.__headers.copy()
-        try:
-            authority = ddl.split("/")[2]
-            download_headers["authority"] = authority
-        except IndexError:
-            print("⚠️ Warning: Could not parse authority from download link.")
+        # Session headers are merged in by requests; only the per-host extra is built here
+        authority = urlsplit(ddl).netloc
+        download_headers = _download_headers(authority) if authority else None
 
         try:
-            res = requests.get(ddl, headers=download_headers, stream=True, timeout=60)
+            res = self.__session.get(ddl, headers=download_headers, stream=True, timeout=60)
             res.raise_for_status()
             if res.status_code == 200:
                 # Return the determined extension string and the response object
                 return file_extension, res
             else:
-                print(f"❌ Error: Download request for book {bookid} returned status {res.status_code}")
+                _log.error("Download request for book %s returned status %s", bookid, res.status_code)
                 return None
         except requests.exceptions.RequestException as e:
-            print(f"❌ Error initiating download stream from {ddl}: {e}")
+            _log.error("Error initiating download stream from %s: %s", ddl, e)
             return None
 
     def downloadBook(self, book: dict[str, str]) -> tuple[str, requests.Response] | None:
@@ -387,9 +677,122 @@ class Zlibrary:
         book_id = book.get("id")
         book_hash = book.get("hash")
         if not book_id or not book_hash:
-            print("❌ Error: Book dictionary missing id or hash for download.")
+            _log.error("Book dictionary missing id or hash for download.")
+            return None
+        result = self.__getBookFile(book_id, book_hash)
+        if result:
+            # Count it locally instead of refetching the profile after every book
+            with self.__profile_lock:
+                self.__downloads_since_refresh += 1
+        return result
+
+    def downloadBookToFile(
+        self,
+        book: dict[str, str],
+        out_dir: str = ".",
+        filename: str = None,
+        chunk_size: int = 1 << 20,
+    ) -> tuple[str, int] | None:
+        """Streams a book straight to out_dir/<filename><extension>; returns (filepath, bytes_written).
+
+        filename defaults to the book id and the extension comes from the API.
+        Only one chunk is held in memory at a time.
+        """
+        download_result = self.downloadBook(book)
+        if not download_result:
             return None
-        return self.__getBookFile(book_id, book_hash)
+        file_extension, response = download_result
+
+        filepath = os.path.join(out_dir, f"{filename or book['id']}{file_extension}")
+        bytes_written = 0
+        try:
+            os.makedirs(out_dir, exist_ok=True)
+            # Written under a .part name and renamed once complete, so a partial file never looks finished
+            with open(f"{filepath}.part", "wb") as f:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    if chunk: # Skip keep-alive chunks
+                        f.write(chunk)
+                        bytes_written += len(chunk)
+            os.replace(f"{filepath}.part", filepath)
+        except (IOError, requests.exceptions.RequestException) as e:
+            _log.error("Error saving book %s to '%s': %s", book.get("id"), filepath, e)
+            try:
+                os.remove(f"{filepath}.part")
+            except OSError:
+                pass
+            return None
+        finally:
+            response.close()
+        return filepath, bytes_written
+
+    def downloadBooks(
+        self,
+        books: list[dict[str, str]],
+        out_dir: str = ".",
+        max_workers: int = 8,
+        filename_fn=None,
+    ):
+        """Downloads books to out_dir on a worker pool, yielding (book, result) as each one finishes.
+
+        result is downloadBookToFile()'s (filepath, bytes_written), or None on
+        failure. filename_fn(book), if given, supplies the base filename. The
+        list is first trimmed to the number of downloads left today. Books are
+        started max_workers at a time; after the first failure no new ones are
+        started, but those already running are still yielded so the caller
+        can record them.
+        """
+        books = list(books)
+        try:
+            books = books[:max(self.getDownloadsLeft(), 0)]
+        except (TypeError, KeyError, ZlibraryAuthError) as e:
+            _log.warning("Could not get downloads left (%s). Attempting all %d books.", e, len(books))
+        if not books:
+            return
+
+        workers = min(max_workers, len(books))
+        remaining = iter(books)
+        running = {}
+        failed = False
+
+        def start_next():
+            book = next(remaining, None)
+            if book is not None:
+                future = executor.submit(
+                    self.downloadBookToFile,
+                    book,
+                    out_dir,
+                    filename_fn(book) if filename_fn else None,
+                )
+                running[future] = book
+
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            for _ in range(workers):
+                start_next()
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    book = running.pop(future)
+                    result = future.result()
+                    if result is None:
+                        failed = True # Likely the daily limit: start nothing new, drain the rest
+                    elif not failed:
+                        start_next()
+                    yield book, result
+        finally:
+            executor.shutdown(wait=True)
+
+    def __gather(self, fn, items, max_workers: int = 8) -> list:
+        """Runs fn over items on a bounded thread pool and returns results in input order.
+
+        The calls are network-bound, so worker threads overlap their round-trips
+        while sharing the pooled session (pool_maxsize covers max_workers).
+        """
+        items = list(items)
+        if not items:
+            return []
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+            return list(executor.map(fn, items))
 
     def isLoggedIn(self) -> bool:
         return self.__loggedin
@@ -429,10 +832,13 @@ class Zlibrary:
         }
         return self.__makePostRequest("/rpc.php", data=usr_data, override=True)
 
-    def getDownloadsLeft(self) -> int:
-        user_profile: dict = self.getProfile()["user"]
-        return user_profile.get("downloads_limit", 10) - user_profile.get(
-            "downloads_today", 0
+    def getDownloadsLeft(self, use_cache: bool = True) -> int:
+        """Remaining downloads today; use_cache=False forces a fresh profile fetch."""
+        user_profile: dict = self.getProfile(max_age=30.0 if use_cache else 0.0)["user"]
+        return (
+            user_profile.get("downloads_limit", 10)
+            - user_profile.get("downloads_today", 0)
+            - self.__downloads_since_refresh
         )
 
     def search_scrape(
@@ -441,7 +847,8 @@ class Zlibrary:
         category_id: int = None, # Now optional
         category_slug: str = None, # Now optional
         search_term: str = None, # New optional parameter
-        enable_file_output: bool = True
+        enable_file_output: bool = True,
+        dump_html: bool = False
      ) -> dict:
         """Scrapes a specific category page OR a search results page on Z-Library.
 
@@ -450,7 +857,9 @@ class Zlibrary:
             category_id: The numerical ID of the category (use if search_term is None).
             category_slug: The text slug of the category (use if search_term is None).
             search_term: The raw search term (use if category_id/slug are None).
-            enable_file_output: If True, writes to raw_html_output.txt and to_download.txt.
+            enable_file_output: If True, writes to to_download.txt.
+            dump_html: If True, also writes the raw card blocks to raw_html_output.txt
+                       for debugging.
 
         Returns:
             A dictionary containing:
@@ -461,7 +870,7 @@ class Zlibrary:
             - 'error': An error message if success is False.
         """
         if not self.isLoggedIn():
-            print("Not logged in")
+            _log.warning("Not logged in")
             return {"success": False, "books_found": 0, "error": "Not logged in", "books_data": []}
 
         # --- Construct URL Dynamically ---
@@ -469,122 +878,92 @@ class Zlibrary:
         scrape_type = "" # For logging
 
         if search_term:
-            from urllib.parse import quote # Use quote instead of quote_plus
             encoded_search_term = quote(search_term)
             # Assuming common filters for search - REMOVE order=popular
-            target_url = f"https://{self.__domain}/s/{encoded_search_term}/?content_type=book&languages%5B0%5D=english&page={page}"
+            target_url = f"{self.__base_url}/s/{encoded_search_term}/?content_type=book&languages%5B0%5D=english&page={page}"
             scrape_type = f"search term '{search_term}'"
         elif category_id and category_slug:
             # Existing category logic
             # Keep order=popular for categories as it was there originally
-            target_url = f"https://{self.__domain}/category/{category_id}/{category_slug}/s/?languages%5B0%5D=english&order=popular&page={page}"
+            target_url = f"{self.__base_url}/category/{category_id}/{category_slug}/s/?languages%5B0%5D=english&order=popular&page={page}"
             scrape_type = f"category {category_id}/{category_slug}"
         else:
             # Error: Insufficient information
             return {"success": False, "books_found": 0, "error": "Must provide either search_term or category_id/category_slug", "books_data": []}
 
-        print(f"Scraping {scrape_type}, Page {page} - URL: {target_url}")
+        _log.info("Scraping %s, Page %s - URL: %s", scrape_type, page, target_url)
 
         # --- Step 1: Fetch the HTML ---
         try:
-            response = requests.get(
-                target_url,
-                cookies=self.__cookies,
-                headers=self.__headers,
-                timeout=30
-            )
+            response = self.__session.get(target_url, timeout=30)
             response.raise_for_status()
 
         except requests.exceptions.RequestException as e:
-            print(f"Error during request to {target_url}: {e}")
+            _log.error("Error during request to %s: %s", target_url, e)
             return {"success": False, "books_found": 0, "error": str(e), "books_data": []}
 
-        html_content = response.text
-
-        # --- Step 2: Extract only <z-bookcard> blocks and save ---
-        print("Extracting book card blocks from HTML...")
-        card_pattern = re.compile(r'<z-bookcard.*?/z-bookcard>', re.DOTALL | re.IGNORECASE)
-        card_matches = card_pattern.findall(html_content)
-        filtered_html_content = "\n".join(card_matches) # Join blocks with newline
+        html_content = response.content
 
-        # --- Save the filtered HTML for debugging/inspection (Optional but helpful) ---
+        # --- Step 2: Open the optional dump of <z-bookcard> blocks ---
+        # Cards are written as they are found in the single pass below, so the
+        # page is scanned once and no joined copy of the cards is built.
         output_filename = "raw_html_output.txt"
-        if enable_file_output:
+        dump_file = None
+        if dump_html:
             try:
-                with open(output_filename, "w", encoding="utf-8") as f:
-                    f.write(filtered_html_content)
-                print(f"Successfully saved {len(card_matches)} book card blocks to {output_filename}")
+                dump_file = open(output_filename, "wb")
             except IOError as e:
-                print(f"Warning: Error saving filtered HTML to file {output_filename}: {e}")
-        else:
-            print(f"Skipping write to {output_filename} (dry run).")
+                _log.warning("Error saving filtered HTML to file %s: %s", output_filename, e)
 
-        # --- Step 3: Parse file content with Regex and Construct List ---
+        # --- Step 3: Parse card blocks and Construct List ---
         books_data = []
 
-        # Regex patterns (same as before)
-        title_inner_pattern = re.compile(r'<div\s+slot=\"title\">(.*?)</div>', re.IGNORECASE)
-        author_inner_pattern = re.compile(r'<div\s+slot=\"author\">(.*?)</div>', re.IGNORECASE)
-
-        print(f"Attempting regex extraction from scraped HTML...")
+        _log.info("Extracting book card blocks and details from scraped HTML...")
 
+        cards_found = 0
         matches_found = 0
-        for card_match in card_pattern.finditer(filtered_html_content): # Iterate directly on filtered content
-            card_text = card_match.group(0) # Get the full text of the block
+        for card_text, book_id, book_hash, title, authors in _iter_book_cards(html_content):
+            if dump_file:
+                try:
+                    if cards_found:
+                        dump_file.write(b"\n")
+                    dump_file.write(card_text)
+                except IOError as e:
+                    _log.warning("Error saving filtered HTML to file %s: %s", output_filename, e)
+                    dump_file.close()
+                    dump_file = None
+            cards_found += 1
+
+            # Basic validation
+            if book_id and book_hash:
+                matches_found += 1 # Count successful extractions
+
+                # Use extracted title/author or placeholders if extraction failed
+                title_print = title if title else "Title Not Found"
+                authors_print = authors if authors else "Author Not Found"
+                _log.debug("  Extracted: ID=%s, Hash=%s, Title='%s', Authors='%s'", book_id, book_hash, title_print, authors_print)
+
+                # Append data to be written to file (without download flag)
+                books_data.append({
+                    "id": book_id,
+                    "hash": book_hash,
+                    "title": title_print, # Use extracted or placeholder
+                    "authors": authors_print, # Use extracted or placeholder
+                })
+            else:
+                # Print details only if it looked like a card but failed ID/Hash
+                _log.warning("Skipped block due to missing ID or Hash. Card start: %r...", card_text[:100])
 
-            # Reset for each card
-            book_id = None
-            book_hash = None
-            title = None
-            authors = None
+        if dump_file:
+            dump_file.close()
+            _log.info("Successfully saved %d book card blocks to %s", cards_found, output_filename)
 
-            try:
-                # Find ID within the block
-                id_match = re.search(r'id=\"(\d+)\"', card_text)
-                if id_match: book_id = id_match.group(1)
-
-                # Find Hash within the block
-                hash_match = re.search(r'href=\"/book/\d+/([a-z0-9]+)/.*?\"', card_text)
-                if hash_match: book_hash = hash_match.group(1)
-
-                # Extract title from inner content
-                title_match = title_inner_pattern.search(card_text)
-                if title_match: title = html.unescape(title_match.group(1).strip())
-
-                # Extract author from inner content
-                author_match = author_inner_pattern.search(card_text)
-                if author_match: authors = html.unescape(author_match.group(1).strip())
-
-                # Basic validation
-                if book_id and book_hash:
-                    matches_found += 1 # Count successful extractions
-
-                    # Use extracted title/author or placeholders if extraction failed
-                    title_print = title if title else "Title Not Found"
-                    authors_print = authors if authors else "Author Not Found"
-                    # print(f"  Regex Extracted: ID={book_id}, Hash={book_hash}, Title='{title_print}', Authors='{authors_print}'") # Verbose logging
-
-                    # Append data to be written to file (without download flag)
-                    books_data.append({
-                        "id": book_id,
-                        "hash": book_hash,
-                        "title": title_print, # Use extracted or placeholder
-                        "authors": authors_print, # Use extracted or placeholder
-                    })
-                else:
-                    # Print details only if it looked like a card but failed ID/Hash
-                    print(f"  Regex Warning: Skipped block due to missing ID or Hash. Card start: {card_text[:100]}...")
-
-            except Exception as e:
-                import traceback
-                print(f"Error processing card block: {e}\n{traceback.format_exc()} - Card start: {card_text[:100]}...")
-
-        print(f"Regex successfully extracted info for {matches_found} books.")
+        _log.info("Successfully extracted info for %d books.", matches_found)
         
         # Determine success based on extraction, books_found is the count
         extraction_successful = True # Assume success unless specific error below
         if matches_found == 0: # Changed condition slightly: 0 matches means 0 books found
-             print("Regex did not extract any book data. This might be the last page or an empty page.")
+             _log.info("Did not extract any book data. This might be the last page or an empty page.")
              # This is considered a successful scrape of an empty page
              pass # Proceed to step 4 logic which handles books_found=0
 
@@ -592,18 +971,46 @@ class Zlibrary:
         download_filename = "to_download.txt"
         if enable_file_output:
             try:
+                # Simple pipe-separated format: ID|HASH|TITLE|AUTHOR, built up front and written in one call
+                payload = "".join(
+                    f"{book['id']}|{book['hash']}|{book['title'].translate(_PIPE_TBL)}|{book['authors'].translate(_PIPE_TBL)}\n"
+                    for book in books_data
+                )
                 with open(download_filename, "w", encoding="utf-8") as f:
-                    for book in books_data:
-                        # Simple pipe-separated format: ID|HASH|TITLE|AUTHOR
-                        line = f"{book['id']}|{book['hash']}|{book['title'].replace('|', ' ')}|{book['authors'].replace('|', ' ')}\n"
-                        f.write(line) # Write the line including the newline character
-                print(f"Successfully saved data for {len(books_data)} books to {download_filename}")
+                    f.write(payload)
+                _log.info("Successfully saved data for %d books to %s", len(books_data), download_filename)
                 # Return based on extraction success, books_found determined above
                 return {"success": extraction_successful, "books_found": len(books_data), "books_data": books_data}
             except IOError as e:
-                print(f"Error saving data to file {download_filename}: {e}")
+                _log.error("Error saving data to file %s: %s", download_filename, e)
                 return {"success": False, "books_found": 0, "error": f"Failed to save download data: {e}", "books_data": []}
         else:
-            print(f"Skipping write to {download_filename} (dry run).")
+            _log.info("Skipping write to %s (dry run).", download_filename)
             # Return based on extraction success, books_found determined above
             return {"success": extraction_successful, "books_found": len(books_data), "books_data": books_data} 
+
+    def search_scrape_many(
+        self,
+        pages: list[int],
+        category_id: int = None,
+        category_slug: str = None,
+        search_term: str = None,
+        max_workers: int = 8
+    ) -> list[dict]:
+        """Scrapes several pages of a category or search concurrently.
+
+        Each page goes through search_scrape() with file output disabled, so
+        the pages' HTTP round-trips overlap on the shared session. Returns one
+        search_scrape() result dict per page, in the order of pages.
+        """
+        return self.__gather(
+            lambda page: self.search_scrape(
+                page=page,
+                category_id=category_id,
+                category_slug=category_slug,
+                search_term=search_term,
+                enable_file_output=False,
+            ),
+            pages,
+            max_workers,
+        )
@@ -2,12 +2,58 @@
 
 import json
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import atexit
 import re
+from concurrent.futures import ThreadPoolExecutor
 import argparse
 import sys
 import os
 from urllib.parse import unquote_plus # Needed for decoding search terms
 
+# orjson is optional; it reads and writes categories.json much faster than json.
+try:
+    import orjson
+
+    _loads = orjson.loads
+
+    def _dumps(data):
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+except ImportError:
+    _loads = json.loads
+
+    def _dumps(data):
+        return json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8')
+
+# ijson is optional; with it the duplicate index is built by streaming entries
+# instead of parsing the whole file up front.
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# selectolax is optional; its C HTML parser replaces the regex <h2> scrape.
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+# URL and page patterns, compiled once
+_CATEGORY_RE = re.compile(r'/category/(\d+)/([^/?]+)') # Stop slug at / or ?
+_SEARCH_RE = re.compile(r'/s/([^/?]+)') # Stop search term at / or ?
+_H2_RE = re.compile(rb'<h2[^>]*>(.*?)</h2>', re.IGNORECASE | re.DOTALL) # On raw bytes; only the capture is decoded
+_H2_CLOSE_RE = re.compile(rb'</h2>', re.IGNORECASE)
+_INNER_TAG_RE = re.compile(r'<[^>]+>')
+
+# One pooled session for every category fetch in this process
+_SESSION = requests.Session()
+_SESSION.headers.update({
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+})
+_SESSION.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=Retry(total=3, backoff_factor=0.3)))
+atexit.register(_SESSION.close)
+
 # --- JSON Helper Functions (similar to zlibdownload.py) ---
 def load_json(file_path):
     """Loads data from a JSON file."""
@@ -15,14 +61,14 @@ def load_json(file_path):
         print(f"ℹ️ File '{file_path}' not found. Starting with an empty list.")
         return [] # Return empty list if file doesn't exist
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        with open(file_path, 'rb') as f:
+            data = _loads(f.read())
         # Basic validation: Ensure it's a list
         if not isinstance(data, list):
              print(f"❌ Error: Expected a JSON list in '{file_path}', found {type(data)}.")
              return None
         return data
-    except json.JSONDecodeError:
+    except ValueError: # json.JSONDecodeError / orjson.JSONDecodeError
         print(f"❌ Error: Could not decode JSON from '{file_path}'. Check format.")
         return None
     except Exception as e:
@@ -32,8 +78,8 @@ def load_json(file_path):
 def save_json(data, file_path):
     """Saves data to a JSON file with indentation."""
     try:
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False) # Use ensure_ascii=False for broader char support
+        with open(file_path, 'wb') as f:
+            f.write(_dumps(data)) # UTF-8 output, non-ASCII names kept as-is
         # print(f"✅ Successfully saved updated data to '{file_path}'") # Keep save message minimal
         return True
     except IOError as e:
@@ -43,18 +89,96 @@ def save_json(data, file_path):
         print(f"❌ An unexpected error occurred saving to '{file_path}': {e}")
         return False
 
+def append_entries_inplace(file_path, new_entries):
+    """Appends new_entries to the JSON list in file_path without re-serialising the rest.
+
+    Only the closing bracket is rewritten, so the cost is the size of the new
+    entries rather than the whole file. Returns False if the file doesn't end in
+    a JSON list, so the caller can fall back to load_json/save_json.
+    """
+    # Indent each entry one level, as json.dump(indent=2) lays out list items
+    entry_bytes = b',\n'.join(b'  ' + _dumps(entry).replace(b'\n', b'\n  ') for entry in new_entries)
+    try:
+        if not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
+            with open(file_path, 'wb') as f:
+                f.write(b'[\n' + entry_bytes + b'\n]')
+            return True
+
+        with open(file_path, 'r+b') as f:
+            # Walk back from the end to the closing ']' and the byte before it
+            end = f.seek(0, os.SEEK_END)
+            block = 4096
+            while True:
+                start = max(0, end - block)
+                f.seek(start)
+                tail = f.read(end - start).rstrip()
+                before = tail[:-1].rstrip()
+                if before or start == 0:
+                    break
+                block *= 2
+            if not tail.endswith(b']') or not before:
+                return False
+            is_empty = before.endswith(b'[')
+            f.seek(start + len(before)) # Right after the last item (or the '[')
+            f.truncate()
+            f.write((b'\n' if is_empty else b',\n') + entry_bytes + b'\n]')
+        return True
+    except IOError as e:
+        print(f"❌ Error appending to '{file_path}': {e}")
+        return False
+
+def _index_entries(entries):
+    """Builds {id: name}, {search_term: name} and the highest order_to_download in one pass."""
+    seen_ids = {}
+    seen_terms = {}
+    max_order = 0
+    for idx, existing_entry in enumerate(entries):
+        # Check existing order, default to 0 if missing/invalid
+        try:
+            current_order = int(existing_entry.get('order_to_download', 0))
+            if current_order > max_order:
+                max_order = current_order
+        except (ValueError, TypeError):
+             print(f"⚠️ Warning: Invalid 'order_to_download' found at index {idx}. Treating as 0 for max order calculation.")
+
+        # Index for O(1) duplicate checks
+        if "id" in existing_entry:
+            seen_ids[existing_entry["id"]] = existing_entry.get("name")
+        if "search_term" in existing_entry:
+            seen_terms[existing_entry["search_term"]] = existing_entry.get("name")
+    return seen_ids, seen_terms, max_order
+
+def index_categories(file_path):
+    """Reads categories.json once and returns (seen_ids, seen_terms, max_order).
+
+    seen_ids/seen_terms map each existing category id / search term to its name.
+    Returns None if the file can't be read.
+    """
+    if ijson is not None and os.path.exists(file_path):
+        try:
+            with open(file_path, 'rb') as f:
+                return _index_entries(ijson.items(f, 'item'))
+        except Exception as e: # ijson.JSONError, IncompleteJSONError, IOError
+            print(f"❌ Error: Could not read JSON from '{file_path}': {e}")
+            return None
+
+    categories = load_json(file_path)
+    if categories is None:
+        return None
+    return _index_entries(categories)
+
 # --- Main Logic ---
 def extract_url_info(url):
     """Extracts relevant info (ID/slug or search term) from a Z-Library URL."""
     # Try category format first
-    category_match = re.search(r'/category/(\d+)/([^/?]+)', url) # Stop slug at / or ?
+    category_match = _CATEGORY_RE.search(url)
     if category_match:
         cat_id = int(category_match.group(1))
         cat_slug = category_match.group(2)
         return {"type": "category", "id": cat_id, "slug": cat_slug}
 
     # Try search format
-    search_match = re.search(r'/s/([^/?]+)', url) # Stop search term at / or ?
+    search_match = _SEARCH_RE.search(url)
     if search_match:
         encoded_term = search_match.group(1)
         try:
@@ -67,22 +191,50 @@ def extract_url_info(url):
     # If neither matches
     return None
 
+def _read_until_h2(response, chunk_size=8192):
+    """Reads a streamed body only up to the first </h2> (or EOF), then closes the response."""
+    page = bytearray()
+    try:
+        for chunk in response.iter_content(chunk_size):
+            scan_from = max(0, len(page) - 4) # A closing tag may straddle two chunks
+            page += chunk
+            if _H2_CLOSE_RE.search(page, scan_from):
+                break
+    finally:
+        response.close() # Drops the rest of the page unread
+    return bytes(page)
+
+def resolve_names(targets, max_workers=8):
+    """Returns the entry name for each (url, url_info) target, fetching category pages concurrently."""
+    def name_for(target):
+        target_url, url_info = target
+        if url_info["type"] == "category":
+            return fetch_category_name(target_url, url_info["slug"])
+        return f"Search: {url_info['search_term']}" # Use search term directly for the name
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(name_for, targets))
+
 def fetch_category_name(url, slug):
     """Fetches the category page and extracts the full name from the H2 tag."""
     print(f"Fetching category name from {url}...")
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
     try:
-        response = requests.get(url, headers=headers, timeout=15)
-        response.raise_for_status() # Raise an exception for bad status codes (4xx or 5xx)
+        with _SESSION.get(url, timeout=15, stream=True) as response: # Released even if raise_for_status() fails
+            response.raise_for_status() # Raise an exception for bad status codes (4xx or 5xx)
+            page = _read_until_h2(response)
         
         # Search for the main category heading (assuming it's in an H2 tag)
-        name_match = re.search(r'<h2[^>]*>(.*?)</h2>', response.text, re.IGNORECASE | re.DOTALL)
-        if name_match:
-            # Clean up the extracted name (remove extra whitespace, potential HTML tags inside)
-            raw_name = name_match.group(1).strip()
-            clean_name = re.sub(r'<[^>]+>', '', raw_name).strip() # Remove inner tags if any
+        if LexborHTMLParser is not None:
+            h2 = LexborHTMLParser(page).css_first('h2')
+            clean_name = h2.text().strip() if h2 else None # Inner tags and entities handled by the parser
+        else:
+            clean_name = None
+            name_match = _H2_RE.search(page)
+            if name_match:
+                # Clean up the extracted name (remove extra whitespace, potential HTML tags inside)
+                raw_name = name_match.group(1).decode(response.encoding or 'utf-8', 'replace').strip()
+                clean_name = _INNER_TAG_RE.sub('', raw_name).strip() # Remove inner tags if any
+        if clean_name:
             print(f"Found category name: '{clean_name}'")
             return clean_name
         else:
@@ -98,91 +250,97 @@ def fetch_category_name(url, slug):
         return slug
 
 def main():
-    parser = argparse.ArgumentParser(description="Add a new category or search term to categories.json from a Z-Library URL.")
-    parser.add_argument("url", help="The full URL of the Z-Library category page OR a search results page (e.g., 'https://z-library.sk/category/52/Techniques/s/?...' or 'https://z-library.sk/s/your%20search/?...')")
+    parser = argparse.ArgumentParser(description="Add new categories or search terms to categories.json from Z-Library URLs.")
+    parser.add_argument("urls", nargs='+', metavar="url", help="One or more full URLs of Z-Library category pages OR search results pages (e.g., 'https://z-library.sk/category/52/Techniques/s/?...' or 'https://z-library.sk/s/your%20search/?...')")
 
     args = parser.parse_args()
-    target_url = args.url
     categories_file = "categories.json"
 
     # 1. Extract info based on URL type
-    url_info = extract_url_info(target_url)
+    targets = []
+    for target_url in args.urls:
+        url_info = extract_url_info(target_url)
+        if url_info is None:
+            print(f"❌ Error: Could not extract category OR search term from URL: {target_url}")
+            print("  Expected format like: .../category/ID/SLUG/... or .../s/SEARCH_TERM/...")
+            continue
+        if url_info["type"] == "category":
+            print(f"Extracted Category ID: {url_info['id']}, Slug: {url_info['slug']}")
+        else:
+            print(f"Extracted Search Term: '{url_info['search_term']}'")
+        targets.append((target_url, url_info))
 
-    if url_info is None:
-        print(f"❌ Error: Could not extract category OR search term from URL: {target_url}")
-        print("  Expected format like: .../category/ID/SLUG/... or .../s/SEARCH_TERM/...")
+    if not targets:
         sys.exit(1)
 
-    entry_type = url_info["type"]
-    cat_id = url_info.get("id")
-    cat_slug = url_info.get("slug")
-    search_term = url_info.get("search_term")
-
-    # 2. Determine Name
-    entry_name = None
-    if entry_type == "category":
-        print(f"Extracted Category ID: {cat_id}, Slug: {cat_slug}")
-        entry_name = fetch_category_name(target_url, cat_slug)
-    elif entry_type == "search":
-        print(f"Extracted Search Term: '{search_term}'")
-        entry_name = f"Search: {search_term}" # Use search term directly for the name
-
-    # 3. Load existing categories
-    categories = load_json(categories_file)
-    if categories is None: # Indicates a loading error
+    # 2. Determine Names (category pages are fetched concurrently)
+    entry_names = resolve_names(targets)
+
+    # 3. Index existing entries once for duplicate checks & the next order
+    index = index_categories(categories_file)
+    if index is None: # Indicates a loading error
         sys.exit(1)
+    seen_ids, seen_terms, max_order = index
 
-    # 4. Check for duplicates & Calculate next order
-    max_order = 0
-    duplicate_found = False
-    for idx, existing_entry in enumerate(categories):
-        # Check existing order, default to 0 if missing/invalid
-        try:
-            current_order = int(existing_entry.get('order_to_download', 0))
-            if current_order > max_order:
-                max_order = current_order
-        except (ValueError, TypeError):
-             print(f"⚠️ Warning: Invalid 'order_to_download' found at index {idx}. Treating as 0 for max order calculation.")
+    new_entries = []
+    for (target_url, url_info), entry_name in zip(targets, entry_names):
+        entry_type = url_info["type"]
+        cat_id = url_info.get("id")
+        cat_slug = url_info.get("slug")
+        search_term = url_info.get("search_term")
+
+        if entry_type == "category" and cat_id in seen_ids:
+            print(f"ℹ️ Category ID {cat_id} ('{seen_ids[cat_id] or cat_slug}') already exists. Skipping.")
+            continue
+        elif entry_type == "search" and search_term in seen_terms:
+            print(f"ℹ️ Search term '{search_term}' ('{seen_terms[search_term] or entry_name}') already exists. Skipping.")
+            continue
+
+        max_order += 1
+        next_order = max_order
+
+        # 4. Create new entry
+        new_entry = {
+            "name": entry_name,
+            "scrape_enabled": False,       # Default: disabled
+            "max_pages_to_scrape": 10,     # Default: 10 pages
+            "next_page_to_scrape": 1,      # Default: start at page 1
+            "books_processed_on_page": 0,  # Default: 0 processed
+            "order_to_download": next_order
+        }
 
-        # Check for duplicates
-        if entry_type == "category" and existing_entry.get("id") == cat_id:
-            print(f"ℹ️ Category ID {cat_id} ('{existing_entry.get('name', cat_slug)}') already exists. No changes made.")
-            duplicate_found = True
-            break
-        elif entry_type == "search" and existing_entry.get("search_term") == search_term:
-            print(f"ℹ️ Search term '{search_term}' ('{existing_entry.get('name', entry_name)}') already exists. No changes made.")
-            duplicate_found = True
-            break
-
-    if duplicate_found:
+        # Add type-specific fields
+        if entry_type == "category":
+            new_entry["id"] = cat_id
+            new_entry["slug"] = cat_slug
+        elif entry_type == "search":
+            new_entry["search_term"] = search_term
+
+        print(f"\nAdding new {entry_type} entry (Order: {next_order}):")
+        print(json.dumps(new_entry, indent=2))
+        new_entries.append(new_entry)
+        # Later URLs in this batch see it as a duplicate too
+        if entry_type == "category":
+            seen_ids[cat_id] = entry_name
+        else:
+            seen_terms[search_term] = entry_name
+
+    if not new_entries:
+        print("No changes made.")
         sys.exit(0)
 
-    next_order = max_order + 1
-
-    # 5. Create new entry
-    new_entry = {
-        "name": entry_name,
-        "scrape_enabled": False,       # Default: disabled
-        "max_pages_to_scrape": 10,     # Default: 10 pages
-        "next_page_to_scrape": 1,      # Default: start at page 1
-        "books_processed_on_page": 0,  # Default: 0 processed
-        "order_to_download": next_order
-    }
-
-    # Add type-specific fields
-    if entry_type == "category":
-        new_entry["id"] = cat_id
-        new_entry["slug"] = cat_slug
-    elif entry_type == "search":
-        new_entry["search_term"] = search_term
-
-    print(f"\nAdding new {entry_type} entry (Order: {next_order}):")
-    print(json.dumps(new_entry, indent=2))
-
-    # 6. Append and Save
-    categories.append(new_entry)
+    # 5. Append and Save once (in place; full rewrite only if the file layout is unexpected)
+    added_names = ", ".join(f"'{entry['name']}'" for entry in new_entries)
+    if append_entries_inplace(categories_file, new_entries):
+        print(f"✅ Successfully added {added_names} to {categories_file}.")
+        return
+
+    categories = load_json(categories_file)
+    if categories is None: # Indicates a loading error
+        sys.exit(1)
+    categories.extend(new_entries)
     if save_json(categories, categories_file):
-        print(f"✅ Successfully added '{entry_name}' to {categories_file}.")
+        print(f"✅ Successfully added {added_names} to {categories_file}.")
     else:
         print(f"❌ Failed to save updated categories to {categories_file}.")
         sys.exit(1)
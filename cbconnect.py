@@ -1,5 +1,7 @@
 import time
 import os # Added for environment variables
+import atexit
+import threading
 from dotenv import load_dotenv # Added for .env file
 from datetime import datetime, timezone, timedelta # Added timedelta
 from couchbase.cluster import Cluster
@@ -12,7 +14,34 @@ load_dotenv() # Load variables from .env file
 # --- Configuration Loaded from Environment Variables --- 
 # Removed hardcoded credentials
 
+# One cluster connection per process; Cluster() + wait_until_ready is expensive
+_cluster = None
+_collection = None
+_connect_lock = threading.Lock()
+
 def connect_db(): # Removed config parameter
+    """
+    Returns the process-wide (cluster, collection), connecting on first use.
+
+    Later calls reuse the same connection instead of repeating the Cluster()
+    handshake; it is closed by shutdown() at interpreter exit.
+
+    Returns:
+        tuple: (cluster, collection) Couchbase cluster and default collection objects, or (None, None) on error.
+    """
+    global _cluster, _collection
+    if _collection is not None:
+        return _cluster, _collection
+    with _connect_lock:
+        if _collection is None: # Another thread may have connected while we waited
+            cluster, collection = _open_db()
+            if collection is None:
+                return None, None
+            _cluster, _collection = cluster, collection
+            atexit.register(shutdown)
+        return _cluster, _collection
+
+def _open_db():
     """
     Establishes a connection to the Couchbase cluster and opens the specified bucket,
     using credentials loaded from environment variables.
@@ -89,7 +118,40 @@ def check_if_downloaded(collection, book_id):
         print(f"  Error checking Couchbase for key '{doc_key}': {e}")
         return False # Assume not downloaded if error occurs
 
-def mark_as_downloaded(collection, book_id, title, authors):
+def check_if_downloaded_batch(collection, book_ids):
+    """
+    Checks many book_ids with a single pipelined exists_multi call instead of one
+    round-trip per book.
+
+    Args:
+        collection: The Couchbase collection object.
+        book_ids (iterable of str): The IDs of the books to check.
+
+    Returns:
+        dict: {book_id: bool}; ids that could not be checked map to False.
+    """
+    book_ids = list(book_ids)
+    if not collection:
+        print("Error: Couchbase collection not available for check.")
+        return {book_id: False for book_id in book_ids} # Can't check if not connected
+    if not book_ids:
+        return {}
+
+    keys = [f"book::{book_id}" for book_id in book_ids]
+    try:
+        result = collection.exists_multi(keys)
+    except CouchbaseException as e:
+        print(f"  Error checking Couchbase for {len(keys)} keys: {e}")
+        return {book_id: False for book_id in book_ids} # Assume not downloaded if error occurs
+
+    for doc_key, error in result.exceptions.items():
+        print(f"  Error checking Couchbase for key '{doc_key}': {error}")
+    return {
+        book_id: doc_key in result.results and result.results[doc_key].exists
+        for book_id, doc_key in zip(book_ids, keys)
+    }
+
+def mark_as_downloaded(collection, book_id, title, authors, download_time=None):
     """
     Creates or updates a document in Couchbase to mark a book as downloaded.
 
@@ -98,6 +160,8 @@ def mark_as_downloaded(collection, book_id, title, authors):
         book_id (str): The ID of the book.
         title (str): The title of the book.
         authors (str): The authors of the book.
+        download_time (str, optional): ISO 8601 timestamp to store; defaults to now (UTC).
+            Callers marking books in a loop can compute it once and pass it in.
 
     Returns:
         bool: True if the operation was successful, False otherwise.
@@ -107,8 +171,9 @@ def mark_as_downloaded(collection, book_id, title, authors):
         return False
 
     doc_key = f"book::{book_id}"
-    # Get current time in UTC and format as ISO 8601 string
-    download_time = datetime.now(timezone.utc).isoformat()
+    if download_time is None:
+        # Get current time in UTC and format as ISO 8601 string
+        download_time = datetime.now(timezone.utc).isoformat()
 
     doc_body = {
         "title": title,
@@ -125,8 +190,60 @@ def mark_as_downloaded(collection, book_id, title, authors):
         print(f"  Error marking book '{doc_key}' as downloaded in Couchbase: {e}")
         return False
 
+def mark_as_downloaded_batch(collection, items):
+    """
+    Marks many books as downloaded with a single pipelined upsert_multi call.
+
+    Args:
+        collection: The Couchbase collection object.
+        items (iterable): (book_id, title, authors) tuples.
+
+    Returns:
+        dict: {book_id: bool}, True where the upsert succeeded.
+    """
+    items = list(items)
+    if not collection:
+        print("Error: Couchbase collection not available for marking download.")
+        return {book_id: False for book_id, _, _ in items}
+    if not items:
+        return {}
+
+    # One timestamp for the whole batch
+    download_time = datetime.now(timezone.utc).isoformat()
+    docs = {
+        f"book::{book_id}": {"title": title, "authors": authors, "downloaded_at": download_time}
+        for book_id, title, authors in items
+    }
+
+    try:
+        result = collection.upsert_multi(docs)
+    except CouchbaseException as e:
+        print(f"  Error marking {len(docs)} books as downloaded in Couchbase: {e}")
+        return {book_id: False for book_id, _, _ in items}
+
+    for doc_key, error in result.exceptions.items():
+        print(f"  Error marking book '{doc_key}' as downloaded in Couchbase: {error}")
+    return {
+        book_id: f"book::{book_id}" in result.results
+        for book_id, _, _ in items
+    }
+
 def close_db(cluster):
-    """Closes the Couchbase cluster connection."""
+    """Closes a Couchbase cluster connection; the shared one from connect_db() stays open until shutdown()."""
+    if cluster is not None and cluster is _cluster:
+        return
+    if cluster:
+        try:
+            cluster.close()
+            print("Couchbase connection closed.")
+        except Exception as e:
+            print(f"Error closing Couchbase connection: {e}")
+
+def shutdown():
+    """Closes the shared connection from connect_db(); registered with atexit."""
+    global _cluster, _collection
+    with _connect_lock:
+        cluster, _cluster, _collection = _cluster, None, None
     if cluster:
         try:
             cluster.close()
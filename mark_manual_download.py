@@ -1,21 +1,48 @@
 import cbconnect
 import argparse
+import csv
 import sys
 
+def load_items(csv_path):
+    """Reads (book_id, title, author) rows from a CSV file; a header row is skipped."""
+    items = []
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        for row in csv.reader(f):
+            if not row or not row[0].strip():
+                continue
+            if row[0].strip().lower() in ("book_id", "id"): # Header row
+                continue
+            if len(row) < 3:
+                print(f"⚠️ Skipping malformed row (expected book_id,title,author): {row}")
+                continue
+            items.append((row[0].strip(), row[1], row[2]))
+    return items
+
 def main():
-    """Parses arguments and marks a book as downloaded in Couchbase."""
-    parser = argparse.ArgumentParser(description="Manually mark a book as downloaded in Couchbase.")
-    parser.add_argument("--book-id", required=True, help="The unique ID of the book.")
-    parser.add_argument("--title", required=True, help="The title of the book.")
-    parser.add_argument("--author", required=True, help="The author(s) of the book.")
+    """Parses arguments and marks one or more books as downloaded in Couchbase."""
+    parser = argparse.ArgumentParser(description="Manually mark books as downloaded in Couchbase.")
+    parser.add_argument("--book-id", help="The unique ID of the book.")
+    parser.add_argument("--title", help="The title of the book.")
+    parser.add_argument("--author", help="The author(s) of the book.")
+    parser.add_argument("--csv", help="CSV file of book_id,title,author rows to mark in one batch.")
 
     args = parser.parse_args()
 
-    book_id = args.book_id
-    title = args.title
-    authors = args.author
-
-    print(f"Attempting to mark book ID: {book_id} ('{title}' by {authors}) as downloaded...")
+    if args.csv:
+        try:
+            items = load_items(args.csv)
+        except IOError as e:
+            print(f"❌ Error reading '{args.csv}': {e}")
+            sys.exit(1)
+        if not items:
+            print(f"ℹ️ No books found in '{args.csv}'. Nothing to do.")
+            return
+        print(f"Attempting to mark {len(items)} books from '{args.csv}' as downloaded...")
+    elif args.book_id and args.title and args.author:
+        items = [(args.book_id, args.title, args.author)]
+        print(f"Attempting to mark book ID: {args.book_id} ('{args.title}' by {args.author}) as downloaded...")
+    else:
+        parser.error("either --csv or all of --book-id, --title and --author are required")
 
     # Connect to Couchbase
     print("Connecting to Couchbase...")
@@ -26,17 +53,22 @@ def main():
         sys.exit(1)
 
     # Mark as downloaded
-    success = cbconnect.mark_as_downloaded(collection, book_id, title, authors)
+    if len(items) == 1:
+        book_id, title, authors = items[0]
+        results = {book_id: cbconnect.mark_as_downloaded(collection, book_id, title, authors)}
+    else:
+        results = cbconnect.mark_as_downloaded_batch(collection, items)
 
     # Print result
-    if success:
-        print(f"✅ Successfully marked book ID {book_id} as downloaded in Couchbase.")
-    else:
-        print(f"❌ Failed to mark book ID {book_id} in Couchbase.")
+    for book_id, success in results.items():
+        if success:
+            print(f"✅ Successfully marked book ID {book_id} as downloaded in Couchbase.")
+        else:
+            print(f"❌ Failed to mark book ID {book_id} in Couchbase.")
 
     # Close connection
     print("Closing Couchbase connection...")
     cbconnect.close_db(cluster)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
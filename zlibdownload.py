@@ -4,21 +4,49 @@ import time
 import json
 import cbconnect
 import sys
-import re
 import logging
 from datetime import datetime
 from tqdm import tqdm
 
+_log = logging.getLogger(__name__)
+
+# str.translate tables: characters that become spaces in file names (runs are collapsed afterwards)
+_AUTHOR_SEPARATORS_TBL = str.maketrans(";|", "  ")
+_INVALID_FILENAME_CHARS_TBL = str.maketrans('\\/?:*"<>|', " " * 9)
+
+# orjson is optional; it parses/serialises the config, state and history pages much faster than json.
+try:
+    import orjson
+
+    _loads = orjson.loads
+
+    def _dumps(obj):
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+
+    def _dumps_pretty(obj):
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode("utf-8")
+except ImportError:
+    _loads = json.loads
+
+    def _dumps(obj):
+        return json.dumps(obj, indent=2, ensure_ascii=False).encode("utf-8")
+
+    def _dumps_pretty(obj):
+        return json.dumps(obj, indent=2)
+
+class ConfigError(Exception):
+    """Raised when the config or categories file is missing, unreadable or incomplete."""
+
 def load_json(file_path):
     """Loads data from a JSON file."""
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        with open(file_path, 'rb') as f:
+            data = _loads(f.read())
         return data
     except FileNotFoundError:
         print(f"❌ Error: File '{file_path}' not found.")
         return None
-    except json.JSONDecodeError:
+    except ValueError: # json.JSONDecodeError / orjson.JSONDecodeError
         print(f"❌ Error: Could not decode JSON from '{file_path}'. Check format.")
         return None
     except Exception as e:
@@ -28,8 +56,8 @@ def load_json(file_path):
 def save_json(data, file_path):
     """Saves data to a JSON file with indentation."""
     try:
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2) 
+        with open(file_path, 'wb') as f:
+            f.write(_dumps(data)) # UTF-8 output, same format add_category.py writes
         print(f"✅ Successfully saved updated data to '{file_path}'")
         return True
     except IOError as e:
@@ -39,50 +67,83 @@ def save_json(data, file_path):
         print(f"❌ An unexpected error occurred saving to '{file_path}': {e}")
         return False
 
+def build_base_filename(title, authors):
+    """Builds a filesystem-safe 'Title - Authors' file name, without extension."""
+    authors_part = authors.translate(_AUTHOR_SEPARATORS_TBL) if authors else "Unknown Author"
+    base_filename = f"{title} - {authors_part}".translate(_INVALID_FILENAME_CHARS_TBL)
+    return " ".join(base_filename.split())
+
+# Index of files saved into output_dir, one "book_id<TAB>filename" line per download
+SAVED_INDEX_FILENAME = ".zlib_saved.tsv"
+
+def load_saved_downloads(output_dir):
+    """Returns {book_id: filename} for books saved into output_dir whose file is still there."""
+    try:
+        with os.scandir(output_dir) as entries:
+            present = {entry.name for entry in entries if entry.is_file()}
+        with open(os.path.join(output_dir, SAVED_INDEX_FILENAME), "r", encoding="utf-8") as f:
+            rows = [line.split('\t', 1) for line in f.read().split('\n') if line]
+    except OSError: # No output_dir or no index yet
+        return {}
+    return {row[0]: row[1] for row in rows if len(row) == 2 and row[1] in present}
+
+def record_saved_download(output_dir, book_id, filename):
+    """Appends book_id -> filename to output_dir's index of saved files."""
+    try:
+        with open(os.path.join(output_dir, SAVED_INDEX_FILENAME), "a", encoding="utf-8") as f:
+            f.write(f"{book_id}\t{filename}\n")
+    except OSError as e:
+        print(f"      ⚠️ Could not record {filename} in {SAVED_INDEX_FILENAME}: {e}")
+
 def fetch_and_save_user_history(z_instance):
     """Fetches all pages of user download history and saves raw responses."""
     print("\n📚 Fetching Full User Download History...")
     raw_history_responses = []
     current_page = 1
     page_limit = 200
+    batch_size = 8 # Pages requested concurrently per round
     total_ids_found = 0
+    done = False
 
-    while True:
-        print(f"  📄 Fetching history page {current_page} (limit {page_limit})...")
+    while not done:
+        pages = range(current_page, current_page + batch_size)
+        print(f"  📄 Fetching history pages {pages[0]}-{pages[-1]} (limit {page_limit})...")
         try:
-            history_response = z_instance.getUserDownloaded(limit=page_limit, page=current_page)
-            
+            batch = z_instance.getUserDownloadedMany(pages, limit=page_limit, max_workers=batch_size)
+        except Exception as e:
+            _log.exception("  ❌ Error during history fetch: %s", e)
+            print("  🛑 Stopping history fetch due to error.")
+            break
+
+        # Walk the batch in page order; anything past the last page is dropped
+        for page_number, history_response in zip(pages, batch):
             if not history_response:
-                print(f"  ⚠️ API request failed for history page {current_page}. Stopping.")
+                print(f"  ⚠️ API request failed for history page {page_number}. Stopping.")
+                done = True
                 break
-            
-            raw_history_responses.append(json.dumps(history_response, indent=2))
+
+            raw_history_responses.append(_dumps_pretty(history_response))
 
             if history_response.get('success') and history_response.get('history'):
                 num_items_on_page = len(history_response['history'])
                 total_ids_found += num_items_on_page
-                print(f"    📊 Found {num_items_on_page} items. Total: {total_ids_found}")
-                
+                print(f"    📊 Page {page_number}: found {num_items_on_page} items. Total: {total_ids_found}")
+
                 if num_items_on_page < page_limit:
                     print("  🏁 Reached the last page of history.")
+                    done = True
                     break
-                
-                current_page += 1
-                time.sleep(0.5)
             else:
                 if not history_response.get('success'):
                     print(f"  ❌ API reported failure: {history_response.get('error', 'N/A')}")
                 elif not history_response.get('history'):
                      print(f"  ❌ API response missing 'history' key or it's empty.")
                 print("  🛑 Stopping history fetch.")
+                done = True
                 break
-                
-        except Exception as e:
-            import traceback
-            print(f"  ❌ Error during history fetch: {e}")
-            print(traceback.format_exc())
-            print("  🛑 Stopping history fetch due to error.")
-            break
+        else:
+            current_page += batch_size
+            time.sleep(0.5)
 
     if raw_history_responses:
         raw_history_filename = "raw_api_history.txt"
@@ -102,17 +163,18 @@ def run_download_process(config_file="config.json", categories_file="categories.
     """
     Main process: Loads config & categories, iterates through enabled categories
     and pages, scrapes, checks Couchbase, downloads, and marks in Couchbase.
+    Raises ConfigError if the config or categories file is unusable.
     """
     # Load Configuration
     print(f"⚙️ Loading configuration from '{config_file}'...")
     config = load_json(config_file)
     if not config:
-        sys.exit(1)
+        raise ConfigError(f"Could not load configuration from '{config_file}'.")
     
     print(f"📋 Loading categories from '{categories_file}'...")
     categories = load_json(categories_file)
     if not categories:
-        sys.exit(1)
+        raise ConfigError(f"Could not load categories from '{categories_file}'.")
 
     # Extract Core Config
     email = config.get("email")
@@ -122,13 +184,17 @@ def run_download_process(config_file="config.json", categories_file="categories.
     output_dir = config.get("output_dir")
     download_filename = "to_download.txt"
     fetch_full = config.get("fetch_full_history", False)
+    dump_html = config.get("debug_dump_html", False)
+    download_workers = config.get("download_workers")
+    if download_workers is None:
+        download_workers = 1
 
     if not email or not password:
-        print("❌ Error: 'email' and 'password' must be specified in config.")
-        sys.exit(1)
+        raise ConfigError("'email' and 'password' must be specified in config.")
     if should_download and not output_dir:
-        print("❌ Error: 'output_dir' must be specified when 'download_books' is true.")
-        sys.exit(1)
+        raise ConfigError("'output_dir' must be specified when 'download_books' is true.")
+    if isinstance(download_workers, bool) or not isinstance(download_workers, int) or download_workers < 1:
+        raise ConfigError(f"'download_workers' must be a positive integer, got {download_workers!r}.")
 
     # Initialize Connections
     print("🔌 Initializing Couchbase connection...")
@@ -167,6 +233,11 @@ def run_download_process(config_file="config.json", categories_file="categories.
     else:
         print("✅ Logged in. Download flag is false, will list/check books only.")
 
+    # Books saved into output_dir on an earlier run, by id, so they are not fetched again
+    saved_downloads = load_saved_downloads(output_dir) if should_download else {}
+    if saved_downloads:
+        print(f"📁 Found {len(saved_downloads)} previously saved book(s) in '{output_dir}'.")
+
     # Call history fetch if requested
     if fetch_full:
         fetch_and_save_user_history(z)
@@ -256,14 +327,16 @@ def run_download_process(config_file="config.json", categories_file="categories.
                     scrape_result = z.search_scrape(
                         search_term=search_term,
                         page=current_page,
-                        enable_file_output=should_download
+                        enable_file_output=should_download,
+                        dump_html=dump_html
                     )
                 else: # It's a category scrape
                     scrape_result = z.search_scrape(
                         category_id=cat_id,
                         category_slug=cat_slug,
                         page=current_page,
-                        enable_file_output=should_download
+                        enable_file_output=should_download,
+                        dump_html=dump_html
                     )
                 # --- End Scrape Call ---
 
@@ -284,18 +357,23 @@ def run_download_process(config_file="config.json", categories_file="categories.
                 page_book_data_iterable = []
                 if should_download:
                     try:
+                        # One read and one split instead of per-line file iteration. Split on '\n' only:
+                        # splitlines() would also break titles containing \x0c, \x85, \u2028 and the like.
                         with open(download_filename, "r", encoding="utf-8") as f:
-                            for line in f:
-                                parts = line.strip().split('|')
-                                if len(parts) == 4:
-                                    page_book_data_iterable.append({
-                                        "id": parts[0],
-                                        "hash": parts[1],
-                                        "title": parts[2],
-                                        "authors": parts[3]
-                                    })
-                                else:
-                                    print(f"  ⚠️ Skipping malformed line: {line.strip()}")
+                            lines = f.read().split('\n')
+                        if lines and not lines[-1]:
+                            lines.pop() # Trailing newline
+                        for line in lines:
+                            parts = line.strip().split('|')
+                            if len(parts) == 4:
+                                page_book_data_iterable.append({
+                                    "id": parts[0],
+                                    "hash": parts[1],
+                                    "title": parts[2],
+                                    "authors": parts[3]
+                                })
+                            else:
+                                print(f"  ⚠️ Skipping malformed line: {line.strip()}")
                     except FileNotFoundError:
                         print(f"  ❌ {download_filename} not found after successful scrape. Skipping page.")
                         break # Skip to next category if file missing
@@ -315,6 +393,17 @@ def run_download_process(config_file="config.json", categories_file="categories.
                 # --- First Pass: Check all books against Couchbase --- 
                 print(f"  Checking {page_book_count} books from page {current_page} against Couchbase...")
 
+                # One pipelined Couchbase lookup for the whole page instead of a round-trip per book
+                skip_count = category.get("books_processed_on_page", 0)
+                page_ids = [book.get("id") for book in page_book_data_iterable[skip_count:] if book.get("id")]
+                try:
+                    downloaded_in_db = cbconnect.check_if_downloaded_batch(collection, page_ids)
+                except Exception as cb_err:
+                    print(f"    ❌ Error checking Couchbase for page {current_page}: {cb_err}. Assuming not downloaded.")
+                    downloaded_in_db = {} # Treat check error as not downloaded
+
+                # Per-book lines are collected and written once per page rather than one write each
+                page_log = []
                 for idx, book_data in enumerate(page_book_data_iterable):
                     # Check skip logic using the value directly from the category dictionary
                     if idx < category.get("books_processed_on_page", 0):
@@ -326,20 +415,16 @@ def run_download_process(config_file="config.json", categories_file="categories.
                     authors = book_data.get("authors", "Unknown Author")
 
                     if not book_id:
-                        print(f"    ⚠️ Skipping book at index {idx} due to missing ID.")
+                        page_log.append(f"    ⚠️ Skipping book at index {idx} due to missing ID.")
                         continue
 
                     # print(f"    📖 ({idx+1}/{page_book_count}) Checking: {book_id} ('{title}')") # Verbose Check
 
-                    # Check Couchbase 
-                    try:
-                        is_already_downloaded_in_db = cbconnect.check_if_downloaded(collection, book_id)
-                    except Exception as cb_err:
-                        print(f"    ❌ Error checking Couchbase for {book_id}: {cb_err}. Assuming not downloaded.")
-                        is_already_downloaded_in_db = False # Treat check error as not downloaded
+                    # Look up the page-wide Couchbase result
+                    is_already_downloaded_in_db = downloaded_in_db.get(book_id, False)
 
                     if is_already_downloaded_in_db:
-                        print(f"      ✓ Already in Couchbase: {book_id} ('{title}')")
+                        page_log.append(f"      ✓ Already in Couchbase: {book_id} ('{title}')")
                         # **Increment the counter in the dictionary directly**
                         category["books_processed_on_page"] = category.get("books_processed_on_page", 0) + 1
                         # We don't save state here, only after a successful download *attempted in this run*.
@@ -348,33 +433,113 @@ def run_download_process(config_file="config.json", categories_file="categories.
                         # Book is NOT in Couchbase
                         # Handle Dry Run or Add to Download List
                         if not should_download:
-                            print(f"      🔍 [DRY RUN] Found New: ID={book_id}, Hash={book_hash}, Title='{title[:60]}...', Authors='{authors[:50]}...'")
+                            page_log.append(f"      🔍 [DRY RUN] Found New: ID={book_id}, Hash={book_hash}, Title='{title[:60]}...', Authors='{authors[:50]}...'")
                             if report_file_handle:
                                 try:
                                     line = f"{book_id}|{book_hash}|{title.replace('|',' ')}|{authors.replace('|',' ')}\n"
                                     report_file_handle.write(line)
                                     dry_run_book_count += 1
                                 except IOError as e:
-                                    print(f"      ❌ [DRY RUN] Error writing to report file: {e}.")
+                                    page_log.append(f"      ❌ [DRY RUN] Error writing to report file: {e}.")
                                     report_file_handle.close()
                                     report_file_handle = None
                             books_processed_this_category += 1 # Counter for dry run summary
                             continue # Go to next book
+                        elif book_id in saved_downloads:
+                            # Saved on an earlier run but never marked (e.g. Couchbase was unreachable then)
+                            page_log.append(f"      📁 Already saved as '{saved_downloads[book_id]}': {book_id} ('{title}'). Marking in Couchbase.")
+                            if cbconnect.mark_as_downloaded(collection, book_id, title, authors):
+                                category["books_processed_on_page"] = category.get("books_processed_on_page", 0) + 1
+                            else:
+                                page_log.append(f"      ⚠️ Failed to mark book {book_id} in Couchbase. State may be inconsistent.")
                         else:
                             # In download mode and book is missing from CB
-                            print(f"      ➕ Not in Couchbase: {book_id} ('{title}'). Will download later.")
+                            page_log.append(f"      ➕ Not in Couchbase: {book_id} ('{title}'). Will download later.")
                             # Store the original index along with the book data
                             books_to_download_this_page.append((idx, book_data))
                             # **DO NOT increment category["books_processed_on_page"] here.**
                             # It will be incremented only after successful download below.
                             # Continue checking the rest of the books on the page.
 
+                if page_log:
+                    print("\n".join(page_log))
                 # --- End of First Pass Check Loop --- 
                 print(f"  Check complete. Found {len(books_to_download_this_page)} book(s) to download for page {current_page}.")
                 # Note: category["books_processed_on_page"] now reflects books found in CB in *this check* + those skipped.
 
                 # --- Second Pass: Attempt Downloads for Missing Books ---
-                if should_download and books_to_download_this_page:
+                if should_download and books_to_download_this_page and download_workers > 1:
+                    # Concurrent variant: downloads overlap on a worker pool, while marking
+                    # and state saves stay on this thread as each book completes.
+                    pending_books = [book for _, book in books_to_download_this_page]
+                    print(f"  Attempting {len(pending_books)} downloads with {download_workers} workers ({downloads_left_today} left reported)...")
+                    # Names must be unique within the batch, or two workers would write the same .part file
+                    batch_filenames = [] # (book, name) pairs, matched by identity since a page can list an id twice
+                    used_names = set()
+                    for book in pending_books:
+                        base_name = build_base_filename(book.get("title", "Unknown Title"), book.get("authors", "Unknown Author"))
+                        if base_name in used_names:
+                            base_name = f"{base_name} [{book.get('id')}]"
+                        suffix = 2
+                        unique_name = base_name
+                        while unique_name in used_names: # Same book id listed twice on the page
+                            unique_name = f"{base_name} ({suffix})"
+                            suffix += 1
+                        used_names.add(unique_name)
+                        batch_filenames.append((book, unique_name))
+                    books_attempted = 0
+                    download_stream = z.downloadBooks(
+                        pending_books,
+                        out_dir=output_dir,
+                        max_workers=download_workers,
+                        filename_fn=lambda b: next(name for book, name in batch_filenames if book is b),
+                    )
+                    try:
+                        for book_data_done, download_result in download_stream:
+                            books_attempted += 1
+                            book_id = book_data_done.get("id")
+                            title = book_data_done.get("title", "Unknown Title")
+                            authors = book_data_done.get("authors", "Unknown Author")
+
+                            if not download_result:
+                                print(f"      ❌ Download failed for book ID {book_id}")
+                                if not halt_run_due_to_limit:
+                                    print("      ⛔ Download attempt failed. No further downloads will be started; finishing those in flight.")
+                                halt_run_due_to_limit = True
+                                continue # downloadBooks starts nothing new, but still yields the running ones so they get recorded
+
+                            filepath, _ = download_result
+                            print(f"      ✅ Saved: {os.path.basename(filepath)}")
+                            record_saved_download(output_dir, book_id, os.path.basename(filepath))
+                            print(f"      📝 Marking book ID {book_id} in Couchbase...")
+                            if not cbconnect.mark_as_downloaded(collection, book_id, title, authors):
+                                print(f"      ⚠️ Failed to mark book {book_id} in Couchbase. State may be inconsistent.")
+                                continue
+
+                            category["books_processed_on_page"] = category.get("books_processed_on_page", 0) + 1
+                            if not save_json(categories, categories_file):
+                                print("      ❌ CRITICAL ERROR: Failed to save state after marking book! Halting.")
+                                cleanup_db()
+                                sys.exit(1)
+                            print(f"      💾 State saved. Processed count for page {current_page}: {category['books_processed_on_page']}")
+
+                            books_processed_this_category += 1
+                            total_downloads_attempted_this_run += 1
+                            downloads_left_today -= 1
+                    except Exception as e:
+                        _log.exception("      ❌ Unexpected error during concurrent downloads: %s", e)
+                        halt_run_due_to_limit = True
+                    finally:
+                        download_stream.close()
+
+                    if not halt_run_due_to_limit and books_attempted < len(pending_books):
+                        # downloadBooks trims the batch to the downloads left today
+                        print("      ⛔ Download limit reached. Halting subsequent downloads.")
+                        halt_run_due_to_limit = True
+                    if not halt_run_due_to_limit:
+                        print(f"  ✅ Finished download attempts for page {current_page}.")
+
+                elif should_download and books_to_download_this_page:
                     print(f"  Attempting downloads...")
                     # Iterate through the list of (index, book_data) tuples
                     for original_index, book_data_to_download in books_to_download_this_page:
@@ -401,24 +566,13 @@ def run_download_process(config_file="config.json", categories_file="categories.
                             if download_result:
                                 file_extension, response = download_result
                                 # Construct Filename 
-                                full_title = title
-                                full_authors = authors
-                                if full_authors:
-                                    authors_with_spaces = re.sub(r'[;|]+', ' ', full_authors)
-                                    clean_authors = re.sub(r'\s+', ' ', authors_with_spaces).strip()
-                                else:
-                                    clean_authors = "Unknown Author"
-                                base_filename = f"{full_title} - {clean_authors}"
-                                invalid_chars_pattern = r'[\\/?:*"<>|]'
-                                clean_base_filename = re.sub(invalid_chars_pattern, ' ', base_filename)
-                                clean_base_filename = re.sub(r'\s+', ' ', clean_base_filename).strip()
-                                final_filename = f"{clean_base_filename}{file_extension}"
+                                final_filename = f"{build_base_filename(title, authors)}{file_extension}"
                                 filepath = os.path.join(output_dir, final_filename)
 
                                 # Save File with Progress Bar
                                 try:
                                     total_size = int(response.headers.get('content-length', 0))
-                                    block_size = 1024
+                                    block_size = 1 << 20 # 1 MiB chunks keep memory flat with few write calls
 
                                     progress_bar = tqdm(
                                         total=total_size,
@@ -435,10 +589,14 @@ def run_download_process(config_file="config.json", categories_file="categories.
                                             progress_bar.close()
                                             continue # Skip this book if dir fails
 
-                                    with open(filepath, "wb") as f:
+                                    # Write to a .part file so an interrupted save never looks finished on the next run
+                                    with open(f"{filepath}.part", "wb") as f:
                                         for data in response.iter_content(block_size):
+                                            if not data: continue # Skip keep-alive chunks
                                             progress_bar.update(len(data))
                                             f.write(data)
+                                    os.replace(f"{filepath}.part", filepath)
+                                    record_saved_download(output_dir, book_id, final_filename)
                                     progress_bar.close()
 
                                     if total_size != 0 and progress_bar.n != total_size:
@@ -477,11 +635,11 @@ def run_download_process(config_file="config.json", categories_file="categories.
                                     if 'progress_bar' in locals() and progress_bar: progress_bar.close()
                                     # If save fails, don't mark in CB or update state
                                 except Exception as e:
-                                    print(f"\n      ❌ Unexpected error during file save/progress for {final_filename}: {e}")
-                                    import traceback
-                                    print(traceback.format_exc())
+                                    _log.exception("\n      ❌ Unexpected error during file save/progress for %s: %s", final_filename, e)
                                     if 'progress_bar' in locals() and progress_bar: progress_bar.close()
                                     # If save fails, don't mark in CB or update state
+                                finally:
+                                    response.close() # Hand the connection back to the pool even on early exit
 
                             else: # Download failed (likely limit hit or API error)
                                 print(f"      ❌ Download failed for book ID {book_id}")
@@ -494,9 +652,7 @@ def run_download_process(config_file="config.json", categories_file="categories.
                                 break 
 
                         except Exception as e: # Error *initiating* download
-                            print(f"      ❌ Unexpected error initiating download for book ID {book_id}: {e}")
-                            import traceback
-                            print(traceback.format_exc())
+                            _log.exception("      ❌ Unexpected error initiating download for book ID %s: %s", book_id, e)
                             halt_run_due_to_limit = True
                             # Break download loop; state saved reflects downloads *before* this failure
                             break 
@@ -566,9 +722,7 @@ def run_download_process(config_file="config.json", categories_file="categories.
     except KeyboardInterrupt:
         print("\n⚠️ Process interrupted by user.")
     except Exception as e:
-        import traceback
-        print(f"\n❌ An unexpected error occurred: {e}")
-        print(traceback.format_exc())
+        _log.exception("\n❌ An unexpected error occurred: %s", e)
     finally:
         # Final Cleanup & Summary
         cleanup_db()
@@ -601,4 +755,10 @@ def run_download_process(config_file="config.json", categories_file="categories.
 
 # Main Execution
 if __name__ == "__main__":
-    run_download_process()
+    # The library reports progress through logging; show INFO like the old prints did
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    try:
+        run_download_process()
+    except ConfigError as e:
+        print(f"❌ Error: {e}")
+        sys.exit(1)